@@ -1,15 +1,158 @@
 # app.py
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 from utils import (
     fetch_pypi_stats,
     fetch_github_stats_api,
-    fetch_lifetime_downloads
+    fetch_lifetime_downloads,
+    downsample,
+    moving_average
 )
 
+
+@st.cache_data
+def compute_metrics(df_pypi, stars_df, current_date):
+    """Computes the key metric scalars so widget-driven reruns reuse them.
+
+    Expects a non-empty df_pypi; callers handle the no-data case.
+    """
+    downloads = df_pypi['downloads'].to_numpy()
+    today_downloads = downloads[-1]
+    yesterday_downloads = downloads[-2] if len(downloads) > 1 else 0
+
+    # One scan over the history before today gives both peaks; the slice is a view
+    previous_peak = downloads[:-1].max() if len(downloads) > 1 else 0
+    max_downloads = max(previous_peak, today_downloads)
+
+    daily_change = today_downloads - yesterday_downloads
+    avg_last_week = downloads[-7:].mean()
+    avg_previous_week = downloads[-14:-7].mean() if len(downloads) >= 14 else 0
+    avg_change = avg_last_week - avg_previous_week
+
+    peak_change = today_downloads - previous_peak
+
+    # stars_df is a sorted, contiguous daily range as built by fetch_github_stats_api
+    if not stars_df.empty:
+        # Both weekly windows are contiguous slices of the sorted history
+        dates = stars_df['date'].to_numpy('datetime64[D]')
+        stars = stars_df['stars'].to_numpy()
+        cumulative = stars_df['cumulative_stars'].to_numpy()
+        current_day = np.datetime64(current_date, 'D')
+        week_start = np.searchsorted(dates, current_day - np.timedelta64(7, 'D'))
+        previous_week_start = np.searchsorted(dates, current_day - np.timedelta64(14, 'D'))
+        # Window sums as differences of the cumulative column
+        stars_before_week = cumulative[week_start - 1] if week_start else 0
+        stars_before_previous_week = cumulative[previous_week_start - 1] if previous_week_start else 0
+        last_week_stars = cumulative[-1] - stars_before_week
+        previous_week_stars = stars_before_week - stars_before_previous_week
+        # Remaining star stats reuse the same array
+        avg_stars_day = f"{stars.mean():.1f}"
+        peak_index = int(stars.argmax())
+        peak_stars_day = stars[peak_index]
+        peak_stars_date = stars_df['date'].iat[peak_index].strftime('%Y-%m-%d')
+    else:
+        last_week_stars, previous_week_stars = 0, 0
+        avg_stars_day, peak_stars_day, peak_stars_date = "0", 0, "N/A"
+
+    counts = {
+        'today_downloads': today_downloads,
+        'max_downloads': max_downloads,
+        'avg_last_week': avg_last_week,
+        'last_week_stars': last_week_stars,
+        'peak_stars_day': peak_stars_day,
+    }
+    changes = {
+        'today_delta': today_downloads,
+        'daily_change': daily_change,
+        'avg_change': avg_change,
+        'peak_change': peak_change,
+        'stars_change': last_week_stars,
+        'week_stars_change': last_week_stars - previous_week_stars,
+    }
+    # Formatted here so cached reruns reuse the display strings as well
+    return {
+        **{key: f"{value:,.0f}" for key, value in counts.items()},
+        **{key: f"{value:+,.0f}" for key, value in changes.items()},
+        'avg_stars_day': avg_stars_day,
+        'peak_stars_date': peak_stars_date,
+    }
+
+
+@st.cache_resource(ttl=60*60)
+def build_downloads_fig(df_pypi, ma_window):
+    """Builds the downloads chart; ma_window=None leaves out the moving average."""
+    # Built as a separate frame so the cached metrics input stays unchanged
+    downloads_df = df_pypi[['date', 'downloads']]
+    if ma_window:
+        downloads_df = downloads_df.assign(MA=moving_average(df_pypi['downloads'], ma_window))
+    downloads_df = downsample(downloads_df, {col: 'mean' for col in downloads_df.columns if col != 'date'})
+
+    fig_downloads = go.Figure()
+    fig_downloads.add_trace(go.Scatter(
+        x=downloads_df['date'],
+        y=downloads_df['downloads'],
+        name='Downloads',
+        mode='lines',
+        line=dict(color='blue')
+    ))
+
+    if ma_window:
+        fig_downloads.add_trace(go.Scatter(
+            x=downloads_df['date'],
+            y=downloads_df['MA'],
+            name=f'{ma_window}-day Moving Average',
+            line=dict(color='red', dash='dash')
+        ))
+
+    fig_downloads.update_layout(
+        title=f'Downloads Over Time',
+        xaxis_title='Date',
+        yaxis_title='Downloads',
+        hovermode='x unified'
+    )
+    return fig_downloads
+
+
+@st.cache_resource(ttl=60*60)
+def build_stars_fig(stars_df):
+    """Builds the cumulative and new stars chart."""
+    stars_plot_df = downsample(stars_df, {'cumulative_stars': 'last', 'stars': 'sum'})
+    fig_stars = go.Figure()
+    fig_stars.add_trace(go.Scatter(
+        x=stars_plot_df['date'],
+        y=stars_plot_df['cumulative_stars'],
+        name='Total Stars',
+        mode='lines',
+        line=dict(color='goldenrod')
+    ))
+    fig_stars.add_trace(go.Bar(
+        x=stars_plot_df['date'],
+        y=stars_plot_df['stars'],
+        name='New Stars',
+        marker_color='gold',
+        yaxis='y2'
+    ))
+    fig_stars.update_layout(
+        title='Stars Growth Over Time',
+        xaxis_title='Date',
+        yaxis_title='Total Stars',
+        yaxis2=dict(
+            title='New Stars',
+            overlaying='y',
+            side='right'
+        ),
+        hovermode='x unified',
+        showlegend=True
+    )
+    return fig_stars
+
+
 # Set page config (only do this in the main file)
 st.set_page_config(
     page_title="Package Analytics Dashboard",
@@ -19,9 +162,10 @@ st.set_page_config(
 
 st.title("Package Analytics Dashboard")
 
-# Session state to hold GitHub repo data
-if 'repo_data' not in st.session_state:
-    st.session_state.repo_data = None
+# Session state to hold fetched data across reruns
+for key in ('lifetime_downloads', 'df_pypi', 'df_github', 'repo_data', 'fetch_params'):
+    if key not in st.session_state:
+        st.session_state[key] = None
 
 # Sidebar controls
 with st.sidebar:
@@ -56,265 +200,167 @@ with st.sidebar:
     if show_moving_average:
         ma_window = st.slider("Moving Average Window", 2, 30, 7)
 
+fetch_params = (package, github_repo, start_date, end_date, granularity)
+
 if st.sidebar.button("Fetch Stats"):
     with st.spinner("Fetching statistics..."):
         try:
-            # Fetch lifetime total downloads
-            lifetime_downloads = fetch_lifetime_downloads(package)
-            
-            # Fetch PyPI stats for the selected date range
-            df_pypi = fetch_pypi_stats(package, start_date, end_date, granularity)
-            
-            # Fetch GitHub stats
-            df_github, repo_data = fetch_github_stats_api(github_repo)
-            
-            # Store repo_data in session state
-            st.session_state.repo_data = repo_data
+            # The three fetches are independent network calls, so run them
+            # concurrently. Worker threads need the script run context to
+            # use st.* (errors, cache spinners) from inside the fetchers.
+            ctx = get_script_run_ctx()
+            with ThreadPoolExecutor(max_workers=3, initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+                lifetime_future = executor.submit(fetch_lifetime_downloads, package)
+                pypi_future = executor.submit(fetch_pypi_stats, package, start_date, end_date, granularity)
+                github_future = executor.submit(fetch_github_stats_api, github_repo)
+
+                lifetime_downloads = lifetime_future.result()
+                df_pypi = pypi_future.result()
+                df_github, repo_data = github_future.result()
             
-            if df_pypi is not None and df_github is not None:
-                # ---- Quick Package Info ----
-                with st.expander("📌 Quick Package Info", expanded=False):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.markdown(f"""
-                        - 📅 **Created**: {pd.to_datetime(repo_data['created_at']).strftime('%Y-%m-%d')}
-                        - 🔄 **Last Updated**: {pd.to_datetime(repo_data['updated_at']).strftime('%Y-%m-%d')}
-                        """)
-                    with col2:
-                        st.markdown(f"""
-                        - 💻 **Language**: {repo_data['language']}
-                        - 📜 **License**: {repo_data.get('license', {}).get('name', 'Not specified')}
-                        """)
-                    if repo_data['description']:
-                        st.markdown(f"📝 **Description**: {repo_data['description']}")
-
-                # ---- Calculate Metrics ----
-                today = df_pypi.iloc[-1] if not df_pypi.empty else pd.Series({'date': None, 'downloads': 0})
-                yesterday = df_pypi.iloc[-2] if len(df_pypi) > 1 else pd.Series({'date': None, 'downloads': 0})
-                
-                total_downloads = lifetime_downloads  # lifetime
-                avg_downloads = df_pypi['downloads'].mean()
-                max_downloads = df_pypi['downloads'].max()
-                
-                daily_change = today['downloads'] - yesterday['downloads']
-                avg_last_week = df_pypi.tail(7)['downloads'].mean()
-                avg_previous_week = df_pypi.tail(14).head(7)['downloads'].mean() if len(df_pypi) >= 14 else 0
-                avg_change = avg_last_week - avg_previous_week
-                
-                current_peak = today['downloads']
-                previous_peak = df_pypi[:-1]['downloads'].max() if len(df_pypi) > 1 else 0
-                peak_change = current_peak - previous_peak
-
-                # GitHub metrics
-                stars_change = 0
-                forks_change = 0
-                if len(df_github) >= 7:
-                    stars_change = repo_data['stargazers_count'] - df_github['stars'].iloc[-7]
-                    forks_change = repo_data['forks_count'] - df_github['forks'].iloc[-7]
-                
-                stars_df = pd.DataFrame(repo_data['stars_history'])
-                if not stars_df.empty:
-                    stars_df['date'] = pd.to_datetime(stars_df['date']).dt.date
-                    current_date = datetime.now().date()
-                    last_week_stars = stars_df[stars_df['date'] >= (current_date - timedelta(days=7))]['stars'].sum()
-                    previous_week_stars = stars_df[
-                        (stars_df['date'] >= (current_date - timedelta(days=14))) &
-                        (stars_df['date'] < (current_date - timedelta(days=7)))
-                    ]['stars'].sum()
-                else:
-                    last_week_stars, previous_week_stars = 0, 0
-
-                # ---- Key Metrics Overview ----
-                st.header("📊 Key Metrics Overview")
-                st.divider()
-
-                # 1) PyPI Stats
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.metric(
-                        "Total Downloads", 
-                        f"{total_downloads:,.0f}",
-                        f"{today['downloads']:+,.0f} today",
-                        help="Total number of package downloads"
-                    )
-                with col2:
-                    st.metric(
-                        "Daily Downloads", 
-                        f"{today['downloads']:,.0f}",
-                        f"{daily_change:+,.0f} vs yesterday",
-                        help="Number of downloads in the last 24 hours"
-                    )
-                with col3:
-                    st.metric(
-                        "Weekly Average", 
-                        f"{avg_last_week:,.0f}",
-                        f"{avg_change:+,.0f} vs last week",
-                        help="Average daily downloads over the past 7 days"
-                    )
-                with col4:
-                    st.metric(
-                        "Peak Downloads", 
-                        f"{max_downloads:,.0f}",
-                        f"{peak_change:+,.0f} from previous",
-                        help="Highest number of downloads in a single day"
-                    )
-
-                # 2) GitHub Stats
-                st.markdown("---")
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.metric(
-                        "Total GitHub Stars", 
-                        f"{repo_data['stargazers_count']:,}",
-                        f"{stars_change:+,} this week",
-                        help="Total number of GitHub stars"
-                    )
-                with col2:
-                    st.metric(
-                        "Stars This Week",
-                        f"{last_week_stars:,}",
-                        f"{last_week_stars - previous_week_stars:+,} vs prev.",
-                        help="Stars gained in the last 7 days"
-                    )
-                with col3:
-                    st.metric(
-                        "Avg Stars/Day",
-                        f"{stars_df['stars'].mean():.1f}" if not stars_df.empty else "0",
-                        help="Average daily stars"
-                    )
-                with col4:
-                    peak_stars_day = stars_df['stars'].max() if not stars_df.empty else 0
-                    peak_stars_date = stars_df.loc[stars_df['stars'].idxmax(), 'date'] if not stars_df.empty else "N/A"
-                    st.metric(
-                        "Peak Stars/Day",
-                        f"{peak_stars_day:,}",
-                        f"on {peak_stars_date}",
-                        help="Most stars received in a single day"
-                    )
-
-                # 3) Repository Stats
-                st.markdown("---")
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.metric(
-                        "Forks",
-                        f"{repo_data['forks_count']:,}",
-                        f"{forks_change:+,} this week",
-                        help="Number of repository forks"
-                    )
-                with col2:
-                    st.metric(
-                        "Contributors",
-                        f"{repo_data['total_contributors']:,}",
-                        help="Total number of contributors"
-                    )
-                with col3:
-                    st.metric(
-                        "Releases",
-                        f"{repo_data['total_releases']:,}",
-                        help="Total number of releases"
-                    )
-                with col4:
-                    st.metric(
-                        "Open Issues",
-                        f"{repo_data['open_issues_count']:,}",
-                        help="Number of open issues"
-                    )
-
-                # ---- Detailed Charts ----
-                st.header("📈 Detailed Statistics")
-                # Download chart
-                st.subheader("Download Trends")
-                fig_downloads = go.Figure()
-                fig_downloads.add_trace(go.Scatter(
-                    x=df_pypi['date'],
-                    y=df_pypi['downloads'],
-                    name='Downloads',
-                    mode='lines',
-                    line=dict(color='blue')
-                ))
-
-                if show_moving_average:
-                    df_pypi['MA'] = df_pypi['downloads'].rolling(window=ma_window).mean()
-                    fig_downloads.add_trace(go.Scatter(
-                        x=df_pypi['date'],
-                        y=df_pypi['MA'],
-                        name=f'{ma_window}-day Moving Average',
-                        line=dict(color='red', dash='dash')
-                    ))
-
-                fig_downloads.update_layout(
-                    title=f'Downloads Over Time',
-                    xaxis_title='Date',
-                    yaxis_title='Downloads',
-                    hovermode='x unified'
-                )
-                st.plotly_chart(fig_downloads, use_container_width=True)
-
-                # Stars chart
-                st.subheader("Stars Growth")
-                if 'stars_history' in repo_data and repo_data['stars_history']:
-                    stars_df = pd.DataFrame(repo_data['stars_history'])
-                    fig_stars = go.Figure()
-                    fig_stars.add_trace(go.Scatter(
-                        x=stars_df['date'],
-                        y=stars_df['cumulative_stars'],
-                        name='Total Stars',
-                        mode='lines',
-                        line=dict(color='goldenrod')
-                    ))
-                    fig_stars.add_trace(go.Bar(
-                        x=stars_df['date'],
-                        y=stars_df['stars'],
-                        name='New Stars',
-                        marker_color='gold',
-                        yaxis='y2'
-                    ))
-                    fig_stars.update_layout(
-                        title='Stars Growth Over Time',
-                        xaxis_title='Date',
-                        yaxis_title='Total Stars',
-                        yaxis2=dict(
-                            title='New Stars',
-                            overlaying='y',
-                            side='right'
-                        ),
-                        hovermode='x unified',
-                        showlegend=True
-                    )
-                    st.plotly_chart(fig_stars, use_container_width=True)
+            # Store fetched data in session state so reruns triggered by other
+            # widgets (e.g. the moving average slider) don't refetch
+            st.session_state.update({
+                'lifetime_downloads': lifetime_downloads,
+                'df_pypi': df_pypi,
+                'df_github': df_github,
+                'repo_data': repo_data,
+                'fetch_params': fetch_params,
+            })
 
         except Exception as e:
             st.error(f"Error fetching data: {str(e)}")
 
+lifetime_downloads = st.session_state.lifetime_downloads
+df_pypi = st.session_state.df_pypi
+df_github = st.session_state.df_github
+repo_data = st.session_state.repo_data
+
+if st.session_state.fetch_params not in (None, fetch_params):
+    st.info("Settings changed since the last fetch. Click **Fetch Stats** to refresh.")
+
+if df_pypi is not None and df_github is not None and df_pypi.empty:
+    st.warning("No PyPI download data found for this package and date range.")
+elif df_pypi is not None and df_github is not None:
+    try:
+        # ---- Quick Package Info ----
+        with st.expander("📌 Quick Package Info", expanded=False):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown(f"""
+                - 📅 **Created**: {pd.to_datetime(repo_data['created_at']).strftime('%Y-%m-%d')}
+                - 🔄 **Last Updated**: {pd.to_datetime(repo_data['updated_at']).strftime('%Y-%m-%d')}
+                """)
+            with col2:
+                st.markdown(f"""
+                - 💻 **Language**: {repo_data['language']}
+                - 📜 **License**: {repo_data.get('license', {}).get('name', 'Not specified')}
+                """)
+            if repo_data['description']:
+                st.markdown(f"📝 **Description**: {repo_data['description']}")
+
+        # ---- Calculate Metrics ----
+        stars_df = repo_data['stars_history']
+        metrics = compute_metrics(df_pypi, stars_df, datetime.now().date())
+
+        # ---- Key Metrics Overview ----
+        st.header("📊 Key Metrics Overview")
+        st.divider()
+
+        # (label, value, delta, help) per metric, one row of four per section
+        metric_rows = [
+            # 1) PyPI Stats
+            [
+                ("Total Downloads", f"{lifetime_downloads:,.0f}",
+                 f"{metrics['today_delta']} today", "Total number of package downloads"),
+                ("Daily Downloads", metrics['today_downloads'],
+                 f"{metrics['daily_change']} vs yesterday", "Number of downloads in the last 24 hours"),
+                ("Weekly Average", metrics['avg_last_week'],
+                 f"{metrics['avg_change']} vs last week", "Average daily downloads over the past 7 days"),
+                ("Peak Downloads", metrics['max_downloads'],
+                 f"{metrics['peak_change']} from previous", "Highest number of downloads in a single day"),
+            ],
+            # 2) GitHub Stats
+            [
+                ("Total GitHub Stars", f"{repo_data['stargazers_count']:,}",
+                 f"{metrics['stars_change']} this week", "Total number of GitHub stars"),
+                ("Stars This Week", metrics['last_week_stars'],
+                 f"{metrics['week_stars_change']} vs prev.", "Stars gained in the last 7 days"),
+                ("Avg Stars/Day", metrics['avg_stars_day'],
+                 None, "Average daily stars"),
+                ("Peak Stars/Day", metrics['peak_stars_day'],
+                 f"on {metrics['peak_stars_date']}", "Most stars received in a single day"),
+            ],
+            # 3) Repository Stats
+            [
+                ("Forks", f"{repo_data['forks_count']:,}",
+                 None, "Number of repository forks"),
+                ("Contributors", f"{repo_data['total_contributors']:,}",
+                 None, "Total number of contributors"),
+                ("Releases", f"{repo_data['total_releases']:,}",
+                 None, "Total number of releases"),
+                ("Open Issues", f"{repo_data['open_issues_count']:,}",
+                 None, "Number of open issues"),
+            ],
+        ]
+        for i, row in enumerate(metric_rows):
+            if i:
+                st.markdown("---")
+            for col, (label, value, delta, help_text) in zip(st.columns(4), row):
+                col.metric(label, value, delta, help=help_text)
+
+        # ---- Detailed Charts ----
+        st.header("📈 Detailed Statistics")
+        # Download chart
+        st.subheader("Download Trends")
+        st.plotly_chart(
+            build_downloads_fig(df_pypi, ma_window if show_moving_average else None),
+            use_container_width=True
+        )
+
+        # Stars chart
+        st.subheader("Stars Growth")
+        if not stars_df.empty:
+            st.plotly_chart(build_stars_fig(stars_df), use_container_width=True)
+            if repo_data.get('stars_history_source') == 'gharchive':
+                st.caption(
+                    "Star history for this repo comes from GH Archive WatchEvents, which start in 2015, "
+                    "don't record unstars and count re-stars again. Daily counts may differ from GitHub's; "
+                    "stars from before 2015 are added to the start of the cumulative line, so its total "
+                    "can run above the current star count."
+                )
+
+    except Exception as e:
+        st.error(f"Error rendering data: {str(e)}")
+
 
 # ---- Releases Section ----
 st.header("Release History")
 with st.expander("📦 View All Releases", expanded=False):
     if st.session_state.repo_data and st.session_state.repo_data.get('releases_data'):
         releases = st.session_state.repo_data['releases_data']
+        published_dates = pd.to_datetime(
+            [r['published_at'] for r in releases], format='%Y-%m-%dT%H:%M:%SZ'
+        ).strftime('%Y-%m-%d')
         release_options = [
-            f"📦 {r['tag_name']} - {datetime.strptime(r['published_at'], '%Y-%m-%dT%H:%M:%SZ').strftime('%Y-%m-%d')}"
-            for r in releases
+            f"📦 {r['tag_name']} - {published}"
+            for r, published in zip(releases, published_dates)
         ]
         selected_release = st.selectbox("Select a release to view details", release_options)
         selected_index = release_options.index(selected_release)
         release = releases[selected_index]
         
-        st.markdown("---")
         body = release['body']
         if "What's Changed" in body:
-            sections = body.split('\n\n')
-            for section in sections:
-                if section.strip():
-                    if section.startswith("What's Changed"):
-                        st.markdown("### 🔄 What's Changed")
-                    elif section.startswith("New Contributors"):
-                        st.markdown("### 👥 New Contributors")
-                    else:
-                        st.markdown(section)
-                    st.markdown("---")
-        else:
-            st.markdown(body)
+            sections = pd.Series(body.split('\n\n'))
+            sections = sections[sections.str.strip() != '']
+            rendered = np.select(
+                [sections.str.startswith("What's Changed"), sections.str.startswith("New Contributors")],
+                ["### 🔄 What's Changed", "### 👥 New Contributors"],
+                default=sections.to_numpy(dtype=object)
+            )
+            body = "".join(f"{section}\n\n---\n\n" for section in rendered)
+        # Separator and release notes go out as a single markdown element
+        st.markdown(f"---\n\n{body}")
     else:
         st.info("No releases found for this package.")
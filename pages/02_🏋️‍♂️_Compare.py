@@ -1,12 +1,14 @@
 # pages/Compare.py
 import streamlit as st
-import pandas as pd
 import plotly.express as px
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 from utils import (
-    fetch_pypi_stats,
-    fetch_lifetime_downloads,
+    GITHUB_REPO_WORKERS,
+    fetch_pypi_stats_multi,
+    fetch_lifetime_downloads_multi,
     fetch_github_stats_api
 )
 
@@ -70,15 +72,28 @@ def compare_packages():
             st.error("Please enter at least one package name.")
             return
         
-        # Container for results
-        all_data = []
+        # One BigQuery scan for all packages, split back out per package
+        with st.spinner("Fetching PyPI downloads..."):
+            df_all = fetch_pypi_stats_multi(tuple(package_list), start_date, end_date, granularity)
+            lifetime_by_package = fetch_lifetime_downloads_multi(tuple(package_list))
+        pypi_by_package = dict(tuple(df_all.groupby('package', observed=True)))
+        
+        # Fetch all GitHub repos concurrently; workers need the script context for st.* calls
+        has_github = len(github_list) == len(package_list)
+        if has_github:
+            ctx = get_script_run_ctx()
+            with st.spinner("Fetching GitHub data..."), ThreadPoolExecutor(
+                max_workers=min(GITHUB_REPO_WORKERS, len(github_list)),
+                initializer=add_script_run_ctx,
+                initargs=(None, ctx),
+            ) as executor:
+                github_results = list(executor.map(fetch_github_stats_api, github_list))
         
         for i, pkg in enumerate(package_list):
             st.subheader(f"**{pkg}**")
             with st.spinner(f"Fetching data for {pkg}..."):
-                # Fetch PyPI data
-                df_pypi = fetch_pypi_stats(pkg, start_date, end_date, granularity)
-                total_downloads = fetch_lifetime_downloads(pkg)
+                df_pypi = pypi_by_package.get(pkg, df_all.iloc[0:0])
+                total_downloads = lifetime_by_package.get(pkg, 0)
                 
                 # Display basic stats
                 if not df_pypi.empty:
@@ -96,9 +111,8 @@ def compare_packages():
                     st.info("No download data found.")
                 
                 # Optional GitHub data
-                if len(github_list) == len(package_list):
-                    repo_name = github_list[i]
-                    df_github, repo_data = fetch_github_stats_api(repo_name)
+                if has_github:
+                    df_github, repo_data = github_results[i]
                     if df_github is not None and repo_data is not None:
                         st.write(f"**GitHub Stars**: {repo_data['stargazers_count']:,}")
                         st.write(f"**Forks**: {repo_data['forks_count']:,}")
@@ -109,17 +123,9 @@ def compare_packages():
                     st.write("_No GitHub repo provided or mismatch in count._")
                 
                 st.markdown("---")
-                
-                # Keep data for final comparison chart
-                if not df_pypi.empty:
-                    # Tag the data by package
-                    temp = df_pypi.copy()
-                    temp['package'] = pkg
-                    all_data.append(temp)
         
         # Overall comparison chart for all packages
-        if all_data:
-            df_all = pd.concat(all_data, ignore_index=True)
+        if not df_all.empty:
             fig_comparison = px.line(
                 df_all,
                 x='date', 
@@ -1,16 +1,28 @@
 # utils.py
 import json
+import time
+import threading
 import base64
+import numpy as np
+import orjson
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+from google.api_core.exceptions import PermissionDenied
 from google.cloud import bigquery
 from google.oauth2 import service_account
 import streamlit as st
 
 # ----------- AUTHENTICATION -----------
+@st.cache_resource
 def load_credentials():
-    """Loads credentials from st.secrets."""
+    """Loads credentials from st.secrets, decoding the service account key once per process."""
     encoded_creds = st.secrets["ENCODED_CREDS"]
     credentials_dict = json.loads(base64.b64decode(encoded_creds).decode())
     credentials = service_account.Credentials.from_service_account_info(
@@ -22,18 +34,80 @@ def load_credentials():
     return credentials, project_id, github_token
 
 
+@st.cache_resource
+def get_bigquery_client():
+    """Process-wide BigQuery client, so auth and transport setup happen once."""
+    credentials, project_id, _ = load_credentials()
+    return bigquery.Client(project=project_id, credentials=credentials)
+
+
+def run_query(query, job_config):
+    """Runs a query and decodes the result through Arrow into a DataFrame."""
+    # The Storage Read API streams columnar Arrow batches instead of JSON rows;
+    # self_destruct frees each Arrow column as its pandas block is built.
+    query_job = get_bigquery_client().query(query, job_config=job_config)
+    try:
+        table = query_job.to_arrow(create_bqstorage_client=True)
+    except PermissionDenied:
+        # Read sessions need bigquery.readsessions.create; without it, page the
+        # already finished job's results over REST instead
+        table = query_job.to_arrow(create_bqstorage_client=False)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+# Threads per fetch_github_stats_api call, and repos fetched at once on the
+# Compare page; the connection pool is sized for both together
+GITHUB_FETCH_WORKERS = 10
+GITHUB_REPO_WORKERS = 4
+
+
+@st.cache_resource
+def get_http_session():
+    """Shared HTTP session so GitHub calls reuse keep-alive connections."""
+    session = requests.Session()
+    # Only host-independent headers here; the GitHub token is added per request
+    session.headers.update({
+        'User-Agent': 'github-repo-stats-dashboard',
+        # gzip/deflate, plus br when brotli is installed
+        'Accept-Encoding': make_headers(accept_encoding=True)['accept-encoding'],
+    })
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=GITHUB_FETCH_WORKERS * GITHUB_REPO_WORKERS,
+        # Hand the last response back once retries run out, so callers can
+        # fall back on its status code instead of catching RetryError. Rate
+        # limited (429) responses aren't retried, and a server Retry-After is
+        # ignored in favour of the short backoff, so no worker sleeps for a minute.
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        ),
+    )
+    session.mount('https://', adapter)
+    return session
+
+
+def parse_json(response):
+    """Decodes a response body with orjson, which is much faster than the stdlib parser."""
+    return orjson.loads(response.content)
+
+
 # ----------- PYPI QUERIES -----------
-@st.cache_data(ttl=60*60*24)
+# (group, select) SQL expressions for each granularity
+TIME_GROUPS = {
+    'hourly':  ('DATETIME_TRUNC(timestamp, HOUR)', 'DATETIME(timestamp)'),
+    'daily':   ('DATE(timestamp)', 'DATE(timestamp)'),
+    'weekly':  ('DATE_TRUNC(DATE(timestamp), WEEK)', 'DATE_TRUNC(DATE(timestamp), WEEK)'),
+    'monthly': ('DATE_TRUNC(DATE(timestamp), MONTH)', 'DATE_TRUNC(DATE(timestamp), MONTH)')
+}
+
+
+@st.cache_data(ttl=60*60*24, max_entries=1024)
 def fetch_pypi_stats(package_name, start_date, end_date, granularity='daily'):
-    credentials, project_id, _ = load_credentials()
-    client = bigquery.Client(project=project_id, credentials=credentials)
-    
-    time_group, select_time = {
-        'hourly':  ('DATETIME_TRUNC(timestamp, HOUR)', 'DATETIME(timestamp)'),
-        'daily':   ('DATE(timestamp)', 'DATE(timestamp)'),
-        'weekly':  ('DATE_TRUNC(DATE(timestamp), WEEK)', 'DATE_TRUNC(DATE(timestamp), WEEK)'),
-        'monthly': ('DATE_TRUNC(DATE(timestamp), MONTH)', 'DATE_TRUNC(DATE(timestamp), MONTH)')
-    }.get(granularity, ('DATE(timestamp)', 'DATE(timestamp)'))
+    time_group, select_time = TIME_GROUPS.get(granularity, TIME_GROUPS['daily'])
     
     query = f"""
     SELECT
@@ -58,104 +132,458 @@ def fetch_pypi_stats(package_name, start_date, end_date, granularity='daily'):
         ]
     )
     
-    return client.query(query, job_config=job_config).to_dataframe()
+    df = run_query(query, job_config)
+    # Plain numpy dtypes instead of Arrow dates and nullable Int64 keep the
+    # cached frame small and let Plotly serialize the columns as typed arrays.
+    # Downloads stay 64-bit: monthly totals of popular packages overflow int32.
+    df['date'] = pd.to_datetime(df['date'])
+    df['downloads'] = df['downloads'].astype('int64')
+    return df
 
-@st.cache_data(ttl=60*60*24)
-def fetch_lifetime_downloads(package_name):
+@st.cache_data(ttl=60*60*24, max_entries=1024)
+def fetch_pypi_stats_multi(package_names, start_date, end_date, granularity='daily'):
+    """Downloads for several packages from a single BigQuery scan, in long format."""
+    time_group, select_time = TIME_GROUPS.get(granularity, TIME_GROUPS['daily'])
+
+    query = f"""
+    SELECT
+        {select_time} AS date,
+        file.project AS package,
+        COUNT(*) AS downloads
+    FROM
+        `bigquery-public-data.pypi.file_downloads`
+    WHERE
+        file.project IN UNNEST(@package_names)
+        AND DATE(timestamp) BETWEEN @start_date AND @end_date
+    GROUP BY
+        date, package
+    ORDER BY
+        package, date
+    """
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("package_names", "STRING", list(package_names)),
+            bigquery.ScalarQueryParameter("start_date", "DATE", start_date),
+            bigquery.ScalarQueryParameter("end_date", "DATE", end_date),
+        ]
+    )
+
+    df = run_query(query, job_config)
+    df['date'] = pd.to_datetime(df['date'])
+    # Categories in request order dedupe the names and fix the legend order
+    df['package'] = pd.Categorical(df['package'], categories=list(dict.fromkeys(package_names)))
+    df['downloads'] = df['downloads'].astype('int64')
+    return df
+
+# Cost guard for the all-partition lifetime scan; BigQuery fails the job
+# instead of billing past this
+LIFETIME_QUERY_MAX_BYTES_BILLED = 50 * 1024 ** 3
+
+
+@st.cache_data(ttl=60*60*24, max_entries=1024)
+def query_lifetime_downloads(package_names):
+    """All-time download counts for several packages from a single BigQuery scan.
+
+    Raises on failure, so errors are never cached as zero downloads.
+    """
+    # There is no public all-time aggregate table, and an all-time count can't
+    # filter on timestamp, so every daily partition since 2016 is read. Clustering
+    # on file.project only limits the blocks read within each partition; bytes
+    # billed still grow with the package's history, hence the 24h cache and batching.
+    query = """
+    SELECT
+        file.project AS package,
+        COUNT(*) AS downloads
+    FROM
+        `bigquery-public-data.pypi.file_downloads`
+    WHERE
+        file.project IN UNNEST(@package_names)
+    GROUP BY
+        package
+    """
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("package_names", "STRING", list(package_names)),
+        ],
+        maximum_bytes_billed=LIFETIME_QUERY_MAX_BYTES_BILLED,
+    )
+
+    df = run_query(query, job_config)
+    return dict(zip(df['package'], df['downloads'].astype('int64').tolist()))
+
+
+def fetch_lifetime_downloads_multi(package_names):
+    """Lifetime download counts per package, or {} after reporting an error."""
     try:
-        # Use PyPI's JSON API
-        url = f"https://pypistats.org/api/packages/{package_name}/overall"
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Sum all download counts
-        total_downloads = sum(item['downloads'] for item in data['data'])
-        return total_downloads
-    except requests.RequestException as e:
-        st.error(f"Error fetching download stats for {package_name}: {str(e)}")
-        return 0
+        return query_lifetime_downloads(package_names)
+    except Exception as e:
+        st.error(f"Error fetching download stats for {', '.join(package_names)}: {str(e)}")
+        return {}
+
+
+def fetch_lifetime_downloads(package_name):
+    """All-time download count for one package; shares the batched query's cache."""
+    return fetch_lifetime_downloads_multi((package_name,)).get(package_name, 0)
 
 
 # ----------- GITHUB QUERIES -----------
+# GitHub only lists the first 400 pages (100 per page) of a repo's stargazers
+REST_STARGAZERS_LIMIT = 40000
+# Requests left untouched by the stargazer walk for the other endpoints and reruns
+STARGAZER_RATE_LIMIT_RESERVE = 100
+# Upper bounds on response bodies kept for ETag revalidation. Stargazer pages
+# get their own budget so one large repo can't evict every other repo's endpoints
+ETAG_STORE_MAX_BYTES = 16 * 1024 * 1024
+STARGAZER_PAGE_STORE_MAX_BYTES = 48 * 1024 * 1024
+# Star histories kept for reuse while a repo's star count is unchanged. The TTL
+# also bounds how long unstar/re-star churn at a steady count goes unnoticed
+REPO_SNAPSHOT_MAX_ENTRIES = 256
+REPO_SNAPSHOT_TTL = 60 * 60 * 24
+
+
+@st.cache_data(ttl=60*60*24)
+def fetch_github_stars_bq(repo_name, start_date, end_date):
+    """Daily star counts for a public repo from the GH Archive WatchEvent tables."""
+    query = """
+    SELECT
+        DATE(created_at) AS date,
+        COUNT(*) AS stars
+    FROM
+        `githubarchive.day.20*`
+    WHERE
+        _TABLE_SUFFIX BETWEEN @start_suffix AND @end_suffix
+        AND type = 'WatchEvent'
+        AND repo.name = @repo_name
+    GROUP BY
+        date
+    ORDER BY
+        date
+    """
+
+    # Only scan the daily tables inside the requested range
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("repo_name", "STRING", repo_name),
+            bigquery.ScalarQueryParameter("start_suffix", "STRING", start_date.strftime('%y%m%d')),
+            bigquery.ScalarQueryParameter("end_suffix", "STRING", end_date.strftime('%y%m%d')),
+        ]
+    )
+
+    return run_query(query, job_config)
+
+
+def parse_last_page(response):
+    """Returns the page number from a GitHub Link rel="last" header, or 1 if absent."""
+    last = response.links.get('last')
+    if not last:
+        return 1
+    return int(parse_qs(urlparse(last['url']).query)['page'][0])
+
+
+class ETagStore:
+    """Byte-bounded LRU of (etag, body, Link header) per request, for conditional GETs."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, etag, content, link):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[key] = (etag, content, link)
+            self.size += len(content)
+            # Evict least recently used bodies until back under budget
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted[1])
+
+
+@st.cache_resource
+def get_etag_store():
+    """Process-wide ETag store, kept across cache expiries for revalidation."""
+    return ETagStore(ETAG_STORE_MAX_BYTES)
+
+
+@st.cache_resource
+def get_stargazer_page_store():
+    """Process-wide ETag store for stargazer pages, the bulk of the stored bytes."""
+    return ETagStore(STARGAZER_PAGE_STORE_MAX_BYTES)
+
+
+def conditional_get(session, store, url, headers, params=None):
+    """GET that revalidates with the request's last ETag and restores the stored body on a 304.
+
+    The session and store are passed in rather than looked up, since this runs
+    on worker threads that have no Streamlit script context.
+    """
+    key = (url, tuple(sorted(params.items())) if params else ())
+    cached = store.get(key)
+    if cached is not None:
+        # A 304 has no body and doesn't count against the rate limit
+        headers = {**headers, 'If-None-Match': cached[0]}
+    response = session.get(url, headers=headers, params=params)
+    if response.status_code == 304 and cached is not None:
+        # Keep the 304's fresh headers (rate limit) but hand callers a normal 200
+        etag, content, link = cached
+        response.status_code = 200
+        response._content = content
+        if link and 'Link' not in response.headers:
+            response.headers['Link'] = link
+        return response
+    if response.status_code == 200 and 'ETag' in response.headers:
+        store.put(key, response.headers['ETag'], response.content, response.headers.get('Link'))
+    return response
+
+
+def get_repo_stats(session, store, url, headers, attempts=5):
+    """Polls a /stats endpoint, which answers 202 while GitHub computes the statistics."""
+    for _ in range(attempts - 1):
+        response = conditional_get(session, store, url, headers)
+        if response.status_code != 202:
+            return response
+        time.sleep(int(response.headers.get('X-Poll-Interval', 2)))
+    return conditional_get(session, store, url, headers)
+
+
+class SnapshotStore:
+    """Entry-bounded LRU whose entries also expire after a fixed TTL."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic(), value)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+@st.cache_resource
+def get_repo_snapshots():
+    """Last star count and daily star counts seen per repo, kept across cache expiries."""
+    return SnapshotStore(REPO_SNAPSHOT_MAX_ENTRIES, REPO_SNAPSHOT_TTL)
+
+
 @st.cache_data(ttl=60*60)
 def fetch_github_stats_api(repo_name):
     credentials, _, github_token = load_credentials()
+    # Resolve the shared resources here: the worker threads below have no script context
+    session = get_http_session()
+    etag_store = get_etag_store()
+    page_store = get_stargazer_page_store()
+    snapshots = get_repo_snapshots()
+    snapshot = snapshots.get(repo_name)
     
     try:
         # Set up headers with authentication
         headers = {
-            'Accept': 'application/vnd.github.v3+json',
-            'Authorization': f'Bearer {github_token}' if github_token else '',
-            'Accept-Encoding': 'gzip, deflate'
+            'Accept': 'application/vnd.github+json',
+            'Authorization': f'Bearer {github_token}' if github_token else ''
         }
         
         base_url = f"https://api.github.com/repos/{repo_name}"
         
-        # Get repository info
-        repo_response = requests.get(base_url, headers=headers)
-        if repo_response.status_code != 200:
-            st.error(f"Error fetching GitHub data: {repo_response.json().get('message', '')}")
-            return None, None
-            
-        repo_data = repo_response.json()
-        
-        # Get stargazers
-        stars_data = []
-        page = 1
-        while True:
-            stars_response = requests.get(
+        # The endpoints below don't depend on each other, so request them
+        # (and the first stargazers page) concurrently
+        stars_headers = {**headers, 'Accept': 'application/vnd.github.star+json'}
+
+        def fetch_stars_page(page):
+            # Older pages rarely change, so most of a refresh comes back as 304s
+            return conditional_get(
+                session,
+                page_store,
                 f"{base_url}/stargazers",
-                headers={**headers, 'Accept': 'application/vnd.github.star+json'},
-                params={'per_page': 100, 'page': page}
+                stars_headers,
+                {'per_page': 100, 'page': page},
             )
-            if stars_response.status_code != 200 or not stars_response.json():
-                break
-            stars_data.extend(stars_response.json())
-            page += 1
+
+        with ThreadPoolExecutor(max_workers=GITHUB_FETCH_WORKERS) as executor:
+            repo_future = executor.submit(conditional_get, session, etag_store, base_url, headers)
+            # With a snapshot the stargazer walk is likely skipped, so wait for the repo first
+            stars_future = executor.submit(fetch_stars_page, 1) if snapshot is None else None
+            commits_future = executor.submit(
+                get_repo_stats, session, etag_store, f"{base_url}/stats/commit_activity", headers
+            )
+            contributors_future = executor.submit(
+                get_repo_stats, session, etag_store, f"{base_url}/stats/contributors", headers
+            )
+            releases_future = executor.submit(conditional_get, session, etag_store, f"{base_url}/releases", headers)
+            prs_future = executor.submit(
+                conditional_get, session, etag_store, f"{base_url}/pulls", headers, {'state': 'all', 'per_page': 1}
+            )
+
+            # Get repository info
+            repo_response = repo_future.result()
+            if repo_response.status_code != 200:
+                st.error(f"Error fetching GitHub data: {parse_json(repo_response).get('message', '')}")
+                return None, None
+
+            repo_data = parse_json(repo_response)
+
+            # Get stargazers. An unchanged star count reuses the last history;
+            # GitHub stops listing them after 400 pages, so for larger public
+            # repos the daily counts come from GH Archive instead
+            star_counts = None
+            stars_complete = True
+            stars_source = 'api'
+            if snapshot and snapshot['stargazers_count'] == repo_data['stargazers_count']:
+                star_counts = snapshot['star_counts']
+                stars_source = snapshot['stars_source']
+            elif not repo_data.get('private') and repo_data['stargazers_count'] > REST_STARGAZERS_LIMIT:
+                try:
+                    archive_df = fetch_github_stars_bq(
+                        repo_name,
+                        pd.to_datetime(repo_data['created_at']).date(),
+                        datetime.now().date()
+                    )
+                    star_counts = pd.Series(
+                        archive_df['stars'].to_numpy(dtype='int64'), index=pd.to_datetime(archive_df['date'])
+                    )
+                    # An empty archive for a repo this large means the query missed, not zero stars
+                    stars_complete = len(star_counts) > 0
+                    stars_source = 'gharchive'
+                except Exception as e:
+                    st.warning(f"Falling back to the GitHub API for star history: {str(e)}")
+
+            if star_counts is None:
+                # The first page's Link header gives the page count, so the
+                # remaining pages can be fetched concurrently
+                first_stars_response = stars_future.result() if stars_future else fetch_stars_page(1)
+                failed_pages = first_stars_response.status_code != 200
+                stars_data = [] if failed_pages else parse_json(first_stars_response)
+                # A revalidated first page may carry a stale Link header, so
+                # also size the walk from the fresh star count
+                last_page = max(
+                    parse_last_page(first_stars_response),
+                    min(-(-repo_data['stargazers_count'] // 100), REST_STARGAZERS_LIMIT // 100),
+                )
+                # Don't let one big repo spend the whole hourly request budget
+                remaining = first_stars_response.headers.get('X-RateLimit-Remaining')
+                budget = int(remaining) - STARGAZER_RATE_LIMIT_RESERVE if remaining else last_page
+                if last_page - 1 > budget:
+                    last_page = max(1, budget + 1)
+                    stars_complete = False
+                    st.warning("GitHub rate limit is running low; the star history only covers the oldest stargazers.")
+                for stars_response in executor.map(fetch_stars_page, range(2, last_page + 1)):
+                    if stars_response.status_code == 200:
+                        stars_data.extend(parse_json(stars_response))
+                    else:
+                        failed_pages = True
+                if failed_pages:
+                    # Don't let a partial history be reused as the repo's snapshot
+                    stars_complete = False
+                    st.warning("Some stargazer pages couldn't be fetched; the star history is incomplete.")
+                if repo_data['stargazers_count'] > REST_STARGAZERS_LIMIT:
+                    # GitHub stops listing after 400 pages, so this walk can't be complete;
+                    # leaving it unsnapshotted also lets the archive be retried next time
+                    stars_complete = False
+                    st.warning(
+                        f"GitHub only lists the first {REST_STARGAZERS_LIMIT:,} stargazers; "
+                        "the star history stops there."
+                    )
+
+                # Parse all timestamps in one vectorised call instead of one per star
+                starred_at = np.fromiter(
+                    (star['starred_at'] for star in stars_data), dtype='U20', count=len(stars_data)
+                )
+                days = pd.to_datetime(starred_at, format='%Y-%m-%dT%H:%M:%SZ').to_numpy('datetime64[D]')
+                # Day offsets from the first star bin straight into a dense daily count
+                first_day = days.min() if len(days) else np.datetime64('today', 'D')
+                daily_stars = np.bincount((days - first_day).astype(np.int64))
+                star_counts = pd.Series(
+                    daily_stars, index=pd.date_range(first_day, periods=len(daily_stars), freq='D')
+                )
+
+            # Commit activity
+            commits_response = commits_future.result()
+            commits_data = parse_json(commits_response) if commits_response.status_code == 200 else []
+
+            # Contributors
+            contributors_response = contributors_future.result()
+            contributors_data = parse_json(contributors_response) if contributors_response.status_code == 200 else []
+
+            # Releases
+            releases_response = releases_future.result()
+            releases_data = parse_json(releases_response) if releases_response.status_code == 200 else []
+
+            # Pull requests. With one PR per page, the last page number is the total
+            prs_response = prs_future.result()
+            if prs_response.status_code != 200:
+                prs_total = 0
+            elif 'last' in prs_response.links:
+                prs_total = parse_last_page(prs_response)
+            else:
+                prs_total = len(parse_json(prs_response))
+
+        if stars_complete:
+            snapshots.put(repo_name, {
+                'stargazers_count': repo_data['stargazers_count'],
+                'star_counts': star_counts,
+                'stars_source': stars_source,
+            })
         
-        if stars_data:
-            stars_df = pd.DataFrame([
-                {'date': pd.to_datetime(star['starred_at']).date(), 'stars': 1}
-                for star in stars_data
-            ])
-            date_range = pd.date_range(stars_df['date'].min(), stars_df['date'].max(), freq='D').date
-            stars_df = stars_df.groupby('date')['stars'].sum().reindex(date_range, fill_value=0).reset_index()
-            stars_df.columns = ['date', 'stars']
+        if len(star_counts):
+            # Run the daily axis through today so trailing windows line up with the calendar
+            end = max(star_counts.index.max(), pd.Timestamp(datetime.now().date()))
+            date_range = pd.date_range(star_counts.index.min(), end, freq='D')
+            stars_df = star_counts.reindex(date_range, fill_value=0).rename_axis('date').reset_index(name='stars')
             stars_df['cumulative_stars'] = stars_df['stars'].cumsum()
-            stars_df['star_change'] = stars_df['stars'].diff().fillna(stars_df['stars'])
+            if stars_source == 'gharchive':
+                # GH Archive starts in 2015, so stars from before then are missing;
+                # lift the running total by that gap. Unstars aren't recorded and
+                # re-stars count twice, so an archive total above the current
+                # count is left as is rather than pushed below zero.
+                offset = repo_data['stargazers_count'] - stars_df['cumulative_stars'].iat[-1]
+                stars_df['cumulative_stars'] += max(offset, 0)
         else:
-            stars_df = pd.DataFrame(columns=['date', 'stars', 'cumulative_stars', 'star_change'])
+            stars_df = pd.DataFrame(columns=['date', 'stars', 'cumulative_stars'])
 
-        # Commit activity
-        commits_response = requests.get(f"{base_url}/stats/commit_activity", headers=headers)
-        commits_data = commits_response.json() if commits_response.status_code == 200 else []
-        
-        # Contributors
-        contributors_response = requests.get(f"{base_url}/stats/contributors", headers=headers)
-        contributors_data = contributors_response.json() if contributors_response.status_code == 200 else []
-        
-        # Releases
-        releases_response = requests.get(f"{base_url}/releases", headers=headers)
-        releases_data = releases_response.json() if releases_response.status_code == 200 else []
-        
-        # Pull requests
-        prs_response = requests.get(f"{base_url}/pulls?state=all&per_page=100", headers=headers)
-        prs_data = prs_response.json() if prs_response.status_code == 200 else []
-        
-        total_commits = sum(week['total'] for week in commits_data) if commits_data else 0
+        stars_df = stars_df.astype({
+            'date': 'datetime64[ns]',
+            'stars': 'int32',
+            'cumulative_stars': 'int64',
+        })
+
+        # One pass over the JSON feeds both the total and the weekly column
+        weekly_commits = np.fromiter(
+            (week['total'] for week in commits_data), dtype=np.int32, count=len(commits_data)
+        )
+        total_commits = int(weekly_commits.sum())
         total_contributors = len(contributors_data)
         total_releases = len(releases_data)
         
-        dates = pd.date_range(end=datetime.now(), periods=len(commits_data), freq='W') if commits_data else []
-        df = pd.DataFrame({
-            'date': dates,
-            'stars': repo_data['stargazers_count'],
-            'forks': repo_data['forks_count'],
-            'open_issues': repo_data['open_issues_count'],
-            'watchers': repo_data['watchers_count'],
-            'weekly_commits': [week['total'] for week in commits_data] if commits_data else [],
-        })
+        dates = pd.date_range(end=datetime.now(), periods=len(weekly_commits), freq='W')
+        # Repo-level counts live in repo_data; the frame is only the weekly series
+        df = pd.DataFrame({'date': dates, 'weekly_commits': weekly_commits})
         
         # Add extra data into repo_data
         repo_data.update({
@@ -165,8 +593,11 @@ def fetch_github_stats_api(repo_name):
             'commits_data': commits_data,
             'contributors_data': contributors_data,
             'releases_data': releases_data,
-            'prs_data': prs_data,
-            'stars_history': stars_df.to_dict('records')
+            'prs_total': prs_total,
+            # Kept as a typed DataFrame: no per-row dicts to build, and the cache
+            # pickles its column buffers directly
+            'stars_history': stars_df,
+            'stars_history_source': stars_source,
         })
         
         return df, repo_data
@@ -174,3 +605,23 @@ def fetch_github_stats_api(repo_name):
     except Exception as e:
         st.error(f"Error fetching GitHub data: {str(e)}")
         return None, None
+
+
+# ----------- CHART HELPERS -----------
+def moving_average(values, window):
+    """Trailing mean over `window` points, NaN until the window is full."""
+    values = np.asarray(values, dtype='float64')
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        cumsum = np.concatenate(([0.0], np.cumsum(values)))
+        result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+
+def downsample(df, aggregations, max_points=3000):
+    """Buckets consecutive rows so at most max_points are sent to the browser."""
+    if len(df) <= max_points:
+        return df
+    bucket_size = -(-len(df) // max_points)
+    buckets = np.arange(len(df)) // bucket_size
+    return df.groupby(buckets).agg({'date': 'first', **aggregations}).reset_index(drop=True)